@@ -17,23 +17,31 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import binascii
-import codecs
-import marshal
+import functools
 import os
 import re
+import sys
 import types as python_types
-
-import numpy as np
-import six
+import weakref
 
 from tensorflow.python.util import nest
-from tensorflow.python.util import tf_contextlib
 from tensorflow.python.util import tf_decorator
 from tensorflow.python.util import tf_inspect
 
 _GLOBAL_CUSTOM_OBJECTS = {}
 _GLOBAL_CUSTOM_NAMES = {}
+# Sentinel for names missing from a custom object dictionary, which lets
+# lookups use a single `dict.get` even when `None` is a registered value.
+_MISSING = object()
+# Memoized results of `_getfullargspec`, keyed weakly by function.
+_ARGSPEC_CACHE = weakref.WeakKeyDictionary()
+_SNAKE_CASE_RE1 = re.compile(r'(.)([A-Z][a-z0-9]+)')
+_SNAKE_CASE_RE2 = re.compile(r'([a-z])([A-Z])')
+
+# Builtin types that can never be wrapped by a `TFDecorator`, for which
+# `serialize_keras_object` skips `tf_decorator.unwrap`.
+_UNWRAP_SKIP_TYPES = frozenset(
+    (bool, int, float, str, bytes, list, tuple, dict, type(None)))
 
 # Flag that determines whether to skip the NotImplementedError when calling
 # get_config in custom models and layers. This is only enabled when saving to
@@ -45,13 +53,13 @@ _LAYER_UNDEFINED_CONFIG_KEY = 'layer was saved without config'
 
 
 class CustomObjectScope(object):
-  """Provides a scope that changes to `_GLOBAL_CUSTOM_OBJECTS` cannot escape.
+  """Provides a scope that temporarily adds to `_GLOBAL_CUSTOM_OBJECTS`.
 
   Code within a `with` statement will be able to access custom objects
-  by name. Changes to global custom objects persist
-  within the enclosing `with` statement. At end of the `with` statement,
-  global custom objects are reverted to state
-  at beginning of the `with` statement.
+  by name. The custom objects passed to the scope are added to the global
+  custom objects within the enclosing `with` statement. At end of the `with`
+  statement, the entries for those names are reverted to their state at
+  beginning of the `with` statement.
 
   Example:
 
@@ -69,25 +77,33 @@ class CustomObjectScope(object):
     self.backup = None
 
   def __enter__(self):
-    self.backup = _GLOBAL_CUSTOM_OBJECTS.copy()
+    # Only back up the entries this scope overrides, rather than copying the
+    # whole registry on every (possibly nested) entry.
+    self.backup = {}
     for objects in self.custom_objects:
+      for name in objects:
+        if name not in self.backup:
+          self.backup[name] = _GLOBAL_CUSTOM_OBJECTS.get(name, _MISSING)
       _GLOBAL_CUSTOM_OBJECTS.update(objects)
     return self
 
   def __exit__(self, *args, **kwargs):
-    _GLOBAL_CUSTOM_OBJECTS.clear()
-    _GLOBAL_CUSTOM_OBJECTS.update(self.backup)
+    for name, obj in self.backup.items():
+      if obj is _MISSING:
+        _GLOBAL_CUSTOM_OBJECTS.pop(name, None)
+      else:
+        _GLOBAL_CUSTOM_OBJECTS[name] = obj
 
 
 def custom_object_scope(*args):
-  """Provides a scope that changes to `_GLOBAL_CUSTOM_OBJECTS` cannot escape.
+  """Provides a scope that temporarily adds to `_GLOBAL_CUSTOM_OBJECTS`.
 
   Convenience wrapper for `CustomObjectScope`.
   Code within a `with` statement will be able to access custom objects
-  by name. Changes to global custom objects persist
-  within the enclosing `with` statement. At end of the `with` statement,
-  global custom objects are reverted to state
-  at beginning of the `with` statement.
+  by name. The custom objects passed to the scope are added to the global
+  custom objects within the enclosing `with` statement. At end of the `with`
+  statement, the entries for those names are reverted to their state at
+  beginning of the `with` statement.
 
   Example:
 
@@ -160,9 +176,10 @@ def register_keras_serializable(package='Custom', name=None):
   def decorator(arg):
     """Registers a class with the Keras serialization framework."""
     class_name = name if name is not None else arg.__name__
-    registered_name = package + '>' + class_name
+    # Interned so that lookups with interned keys short-circuit on identity.
+    registered_name = sys.intern(package + '>' + class_name)
 
-    if tf_inspect.isclass(arg) and not hasattr(arg, 'get_config'):
+    if isinstance(arg, type) and not hasattr(arg, 'get_config'):
       raise ValueError(
           'Cannot register a class that does not have a get_config() method.')
 
@@ -196,21 +213,33 @@ def get_registered_name(obj):
     The name associated with the object, or the default Python name if the
       object is not registered.
   """
-  if obj in _GLOBAL_CUSTOM_NAMES:
-    return _GLOBAL_CUSTOM_NAMES[obj]
-  else:
-    return obj.__name__
+  return _GLOBAL_CUSTOM_NAMES.get(obj) or obj.__name__
 
 
-@tf_contextlib.contextmanager
-def skip_failed_serialization():
-  global _SKIP_FAILED_SERIALIZATION
-  prev = _SKIP_FAILED_SERIALIZATION
-  try:
+class _SkipFailedSerialization(object):
+  """Scope that suppresses `NotImplementedError` from `get_config`.
+
+  Implemented as a plain class rather than a generator-based context manager
+  since it is entered on every (possibly nested) serialization call.
+  """
+
+  __slots__ = ('_prev',)
+
+  def __init__(self):
+    self._prev = None
+
+  def __enter__(self):
+    global _SKIP_FAILED_SERIALIZATION
+    self._prev = _SKIP_FAILED_SERIALIZATION
     _SKIP_FAILED_SERIALIZATION = True
-    yield
-  finally:
-    _SKIP_FAILED_SERIALIZATION = prev
+    return self
+
+  def __exit__(self, *args, **kwargs):
+    global _SKIP_FAILED_SERIALIZATION
+    _SKIP_FAILED_SERIALIZATION = self._prev
+
+
+skip_failed_serialization = _SkipFailedSerialization
 
 
 def get_registered_object(name, custom_objects=None, module_objects=None):
@@ -239,18 +268,22 @@ def get_registered_object(name, custom_objects=None, module_objects=None):
     An instantiable class associated with 'name', or None if no such class
       exists.
   """
-  if name in _GLOBAL_CUSTOM_OBJECTS:
-    return _GLOBAL_CUSTOM_OBJECTS[name]
-  elif custom_objects and name in custom_objects:
-    return custom_objects[name]
-  elif module_objects and name in module_objects:
-    return module_objects[name]
+  obj = _GLOBAL_CUSTOM_OBJECTS.get(name, _MISSING)
+  if obj is not _MISSING:
+    return obj
+  if custom_objects:
+    obj = custom_objects.get(name, _MISSING)
+    if obj is not _MISSING:
+      return obj
+  if module_objects:
+    return module_objects.get(name)
   return None
 
 
 def serialize_keras_object(instance):
   """Serialize Keras object into JSON."""
-  _, instance = tf_decorator.unwrap(instance)
+  if type(instance) not in _UNWRAP_SKIP_TYPES:
+    _, instance = tf_decorator.unwrap(instance)
   if instance is None:
     return None
 
@@ -263,35 +296,38 @@ def serialize_keras_object(instance):
         return serialize_keras_class_and_config(
             name, {_LAYER_UNDEFINED_CONFIG_KEY: True})
       raise e
-    serialization_config = {}
-    for key, item in config.items():
-      if isinstance(item, six.string_types):
-        serialization_config[key] = item
-        continue
-
-      # Any object of a different type needs to be converted to string or dict
-      # for serialization (e.g. custom functions, custom classes)
-      try:
-        serialized_item = serialize_keras_object(item)
-        if isinstance(serialized_item, dict) and not isinstance(item, dict):
-          serialized_item['__passive_serialization__'] = True
-        serialization_config[key] = serialized_item
-      except ValueError:
-        serialization_config[key] = item
-
-    name = get_registered_name(instance.__class__)
+    # pylint: disable=unidiomatic-typecheck
+    serialization_config = {
+        key: item if type(item) is str else _serialize_config_item(item)
+        for key, item in config.items()
+    }
+    # pylint: enable=unidiomatic-typecheck
     return serialize_keras_class_and_config(name, serialization_config)
   if hasattr(instance, '__name__'):
     return get_registered_name(instance)
   raise ValueError('Cannot serialize', instance)
 
 
+def _serialize_config_item(item):
+  """Serializes a non-string value of a Keras object's config."""
+  # Any object of a different type needs to be converted to string or dict
+  # for serialization (e.g. custom functions, custom classes)
+  try:
+    serialized_item = serialize_keras_object(item)
+  except ValueError:
+    return item
+  if isinstance(serialized_item, dict) and not isinstance(item, dict):
+    serialized_item['__passive_serialization__'] = True
+  return serialized_item
+
+
 def get_custom_objects_by_name(item, custom_objects=None):
   """Returns the item if it is in either local or global custom objects."""
-  if item in _GLOBAL_CUSTOM_OBJECTS:
-    return _GLOBAL_CUSTOM_OBJECTS[item]
-  elif custom_objects and item in custom_objects:
-    return custom_objects[item]
+  obj = _GLOBAL_CUSTOM_OBJECTS.get(item, _MISSING)
+  if obj is not _MISSING:
+    return obj
+  if custom_objects:
+    return custom_objects.get(item)
   return None
 
 
@@ -301,27 +337,60 @@ def class_and_config_for_serialized_keras_object(
     custom_objects=None,
     printable_module_name='object'):
   """Returns the class name and config for a serialized keras object."""
+  return _class_and_config_for_serialized_keras_object(
+      config, module_objects, custom_objects, printable_module_name,
+      _merge_custom_objects(custom_objects))
+
+
+def _merge_custom_objects(custom_objects):
+  """Merges `custom_objects` with the global custom objects for lookups.
+
+  Global custom objects take precedence, as in `get_registered_object`.
+  """
+  if not custom_objects:
+    return _GLOBAL_CUSTOM_OBJECTS
+  custom_lookup = dict(custom_objects)
+  custom_lookup.update(_GLOBAL_CUSTOM_OBJECTS)
+  return custom_lookup
+
+
+def _class_and_config_for_serialized_keras_object(
+    config, module_objects, custom_objects, printable_module_name,
+    custom_lookup):
+  """Implements `class_and_config_for_serialized_keras_object`.
+
+  `custom_lookup` is the result of `_merge_custom_objects(custom_objects)`. It
+  is computed once for the outermost config and shared with nested configs,
+  which are deserialized with the same custom objects.
+  """
   if (not isinstance(config, dict) or 'class_name' not in config or
       'config' not in config):
     raise ValueError('Improper config format: ' + str(config))
 
   class_name = config['class_name']
+  if type(class_name) is str:  # pylint: disable=unidiomatic-typecheck
+    # `sys.intern` rejects str subclasses.
+    class_name = sys.intern(class_name)
   cls = get_registered_object(class_name, custom_objects, module_objects)
   if cls is None:
     raise ValueError('Unknown ' + printable_module_name + ': ' + class_name)
 
   cls_config = config['config']
-  deserialized_objects = {}
+  # Serialized configs only ever contain plain dicts and strings, so exact type
+  # checks suffice here.
+  # pylint: disable=unidiomatic-typecheck
   for key, item in cls_config.items():
-    if isinstance(item, dict) and '__passive_serialization__' in item:
-      deserialized_objects[key] = deserialize_keras_object(
+    if type(item) is dict and '__passive_serialization__' in item:
+      # Only values of existing keys are replaced, which is safe to do while
+      # iterating over the dict.
+      cls_config[key] = _deserialize_keras_object(
           item,
           module_objects=module_objects,
           custom_objects=custom_objects,
-          printable_module_name='config_item')
+          printable_module_name='config_item',
+          custom_lookup=custom_lookup)
     # TODO(momernick): Should this also have 'module_objects'?
-    elif (isinstance(item, six.string_types) and
-          tf_inspect.isfunction(get_registered_object(item, custom_objects))):
+    elif type(item) is str and tf_inspect.isfunction(custom_lookup.get(item)):
       # Handle custom functions here. When saving functions, we only save the
       # function's name as a string. If we find a matching string in the custom
       # objects during deserialization, we convert the string back to the
@@ -330,9 +399,8 @@ def class_and_config_for_serialized_keras_object(
       # conflict with a custom function name, but this should be a rare case.
       # This issue does not occur if a string field has a naming conflict with
       # a custom object, since the config of an object will always be a dict.
-      deserialized_objects[key] = get_registered_object(item, custom_objects)
-  for key, item in deserialized_objects.items():
-    cls_config[key] = deserialized_objects[key]
+      cls_config[key] = custom_lookup[item]
+  # pylint: enable=unidiomatic-typecheck
 
   return (cls, cls_config)
 
@@ -341,25 +409,38 @@ def deserialize_keras_object(identifier,
                              module_objects=None,
                              custom_objects=None,
                              printable_module_name='object'):
+  return _deserialize_keras_object(
+      identifier, module_objects, custom_objects, printable_module_name,
+      custom_lookup=None)
+
+
+def _deserialize_keras_object(identifier, module_objects, custom_objects,
+                              printable_module_name, custom_lookup):
+  """Implements `deserialize_keras_object`.
+
+  `custom_lookup` is the merged lookup shared by nested configs (see
+  `_class_and_config_for_serialized_keras_object`), or None to build it here.
+  """
   if identifier is None:
     return None
 
   if isinstance(identifier, dict):
     # In this case we are dealing with a Keras config dictionary.
     config = identifier
-    (cls, cls_config) = class_and_config_for_serialized_keras_object(
-        config, module_objects, custom_objects, printable_module_name)
+    if custom_lookup is None:
+      custom_lookup = _merge_custom_objects(custom_objects)
+    (cls, cls_config) = _class_and_config_for_serialized_keras_object(
+        config, module_objects, custom_objects, printable_module_name,
+        custom_lookup)
 
     if hasattr(cls, 'from_config'):
-      arg_spec = tf_inspect.getfullargspec(cls.from_config)
+      arg_spec = _getfullargspec(cls.from_config)
       custom_objects = custom_objects or {}
 
       if 'custom_objects' in arg_spec.args:
         return cls.from_config(
             cls_config,
-            custom_objects=dict(
-                list(_GLOBAL_CUSTOM_OBJECTS.items()) +
-                list(custom_objects.items())))
+            custom_objects={**_GLOBAL_CUSTOM_OBJECTS, **custom_objects})
       with CustomObjectScope(custom_objects):
         return cls.from_config(cls_config)
     else:
@@ -369,19 +450,20 @@ def deserialize_keras_object(identifier,
       custom_objects = custom_objects or {}
       with CustomObjectScope(custom_objects):
         return cls(**cls_config)
-  elif isinstance(identifier, six.string_types):
+  elif isinstance(identifier, str):
     object_name = identifier
-    if custom_objects and object_name in custom_objects:
-      obj = custom_objects.get(object_name)
-    elif object_name in _GLOBAL_CUSTOM_OBJECTS:
-      obj = _GLOBAL_CUSTOM_OBJECTS[object_name]
-    else:
+    obj = _MISSING
+    if custom_objects:
+      obj = custom_objects.get(object_name, _MISSING)
+    if obj is _MISSING:
+      obj = _GLOBAL_CUSTOM_OBJECTS.get(object_name, _MISSING)
+    if obj is _MISSING:
       obj = module_objects.get(object_name)
       if obj is None:
         raise ValueError('Unknown ' + printable_module_name + ':' + object_name)
     # Classes passed by name are instantiated with no args, functions are
     # returned as-is.
-    if tf_inspect.isclass(obj):
+    if isinstance(obj, type):
       return obj()
     return obj
   elif tf_inspect.isfunction(identifier):
@@ -401,6 +483,10 @@ def func_dump(func):
   Returns:
       A tuple `(code, defaults, closure)`.
   """
+  # Imported lazily since function serialization is rarely used.
+  import codecs  # pylint: disable=g-import-not-at-top
+  import marshal  # pylint: disable=g-import-not-at-top
+
   if os.name == 'nt':
     raw_code = marshal.dumps(func.__code__).replace(b'\\', b'/')
     code = codecs.encode(raw_code, 'base64').decode('ascii')
@@ -427,6 +513,11 @@ def func_load(code, defaults=None, closure=None, globs=None):
   Returns:
       A function object.
   """
+  # Imported lazily since function serialization is rarely used.
+  import binascii  # pylint: disable=g-import-not-at-top
+  import codecs  # pylint: disable=g-import-not-at-top
+  import marshal  # pylint: disable=g-import-not-at-top
+
   if isinstance(code, (tuple, list)):  # unpack previous dump
     code, defaults, closure = code
     if isinstance(defaults, list):
@@ -476,12 +567,33 @@ def has_arg(fn, name, accept_all=False):
   Returns:
       bool, whether `fn` accepts a `name` keyword argument.
   """
-  arg_spec = tf_inspect.getfullargspec(fn)
+  arg_spec = _getfullargspec(fn)
   if accept_all and arg_spec.varkw is not None:
     return True
   return name in arg_spec.args
 
 
+def _getfullargspec(fn):
+  """Returns `tf_inspect.getfullargspec(fn)`, memoized per function.
+
+  Bound methods share the argspec of their underlying function and are cached
+  under it, so that the cache does not keep the bound instance alive.
+  """
+  key = fn.__func__ if isinstance(fn, python_types.MethodType) else fn
+  try:
+    return _ARGSPEC_CACHE[key]
+  except (KeyError, TypeError):
+    pass
+  arg_spec = tf_inspect.getfullargspec(fn)
+  try:
+    _ARGSPEC_CACHE[key] = arg_spec
+  except TypeError:
+    # Callables that are unhashable or cannot be weakly referenced are not
+    # cached.
+    pass
+  return arg_spec
+
+
 def make_batches(size, batch_size):
   """Returns a list of batch indices (tuples of indices).
 
@@ -492,7 +604,7 @@ def make_batches(size, batch_size):
   Returns:
       A list of tuples of array indices.
   """
-  num_batches = int(np.ceil(size / float(batch_size)))
+  num_batches = (size + batch_size - 1) // batch_size
   return [(i * batch_size, min(size, (i + 1) * batch_size))
           for i in range(0, num_batches)]
 
@@ -525,24 +637,28 @@ def slice_arrays(arrays, start=None, stop=None):
                      'is a list.')
   elif isinstance(arrays, list):
     if hasattr(start, '__len__'):
-      # hdf5 datasets only support list objects as indices
-      if hasattr(start, 'shape'):
-        start = start.tolist()
-      return [None if x is None else x[start] for x in arrays]
+      return [None if x is None else _take_indices(x, start) for x in arrays]
     return [
         None if x is None else
         None if not hasattr(x, '__getitem__') else x[start:stop] for x in arrays
     ]
   else:
     if hasattr(start, '__len__'):
-      if hasattr(start, 'shape'):
-        start = start.tolist()
-      return arrays[start]
+      return _take_indices(arrays, start)
     if hasattr(start, '__getitem__'):
       return arrays[start:stop]
     return [None]
 
 
+def _take_indices(array, indices):
+  """Indexes `array` with a list or array of `indices`."""
+  # hdf5 datasets only support list objects as indices. Other array-likes are
+  # indexed directly, which keeps numpy fancy indexing out of Python ints.
+  if hasattr(indices, 'shape') and type(array).__module__.startswith('h5py'):
+    indices = indices.tolist()
+  return array[indices]
+
+
 def to_list(x):
   """Normalizes a list/tensor into a list.
 
@@ -555,14 +671,22 @@ def to_list(x):
   Returns:
       A list.
   """
-  if isinstance(x, list):
+  # Exact type check first, since most callers pass a plain list.
+  # pylint: disable=unidiomatic-typecheck
+  if type(x) is list or isinstance(x, list):
     return x
+  # pylint: enable=unidiomatic-typecheck
   return [x]
 
 
 def to_snake_case(name):
-  intermediate = re.sub('(.)([A-Z][a-z0-9]+)', r'\1_\2', name)
-  insecure = re.sub('([a-z])([A-Z])', r'\1_\2', intermediate).lower()
+  return _to_snake_case(name)
+
+
+@functools.lru_cache(maxsize=1024)
+def _to_snake_case(name):
+  intermediate = _SNAKE_CASE_RE1.sub(r'\1_\2', name)
+  insecure = _SNAKE_CASE_RE2.sub(r'\1_\2', intermediate).lower()
   # If the class is private the name starts with "_" which is not secure
   # for creating scopes. We prefix the name with "private" in this case.
   if insecure[0] != '_':
@@ -571,19 +695,35 @@ def to_snake_case(name):
 
 
 def is_all_none(structure):
-  iterable = nest.flatten(structure)
-  # We cannot use Python's `any` because the iterable may return Tensors.
-  for element in iterable:
-    if element is not None:
-      return False
+  # Walk the structure lazily instead of calling `nest.flatten`, so that we
+  # can stop at the first non-None element without building the full list.
+  stack = [iter((structure,))]
+  while stack:
+    for element in stack[-1]:
+      if nest.is_sequence(element):
+        if isinstance(element, (list, tuple)):
+          stack.append(iter(element))
+        elif isinstance(element, dict):
+          stack.append(iter(element.values()))
+        else:
+          stack.append(iter(nest.flatten(element)))
+        break
+      # We cannot use Python's `any` because the iterable may return Tensors.
+      if element is not None:
+        return False
+    else:
+      stack.pop()
   return True
 
 
 def check_for_unexpected_keys(name, input_dict, expected_values):
-  unknown = set(input_dict.keys()).difference(expected_values)
+  expected_lookup = expected_values
+  if isinstance(expected_values, (list, tuple)):
+    expected_lookup = frozenset(expected_values)
+  unknown = [key for key in input_dict if key not in expected_lookup]
   if unknown:
     raise ValueError('Unknown entries in {} dictionary: {}. Only expected '
-                     'following keys: {}'.format(name, list(unknown),
+                     'following keys: {}'.format(name, unknown,
                                                  expected_values))
 
 
@@ -18,6 +18,13 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import functools
+import gc
+import math
+import weakref
+
+import numpy as np
+
 from tensorflow.python import keras
 from tensorflow.python.frozen_keras import regularizers
 from tensorflow.python.frozen_keras.utils import generic_utils
@@ -54,6 +61,21 @@ class HasArgTest(test.TestCase):
     self.assertTrue(generic_utils.has_arg(
         f_x_kwargs, 'y', accept_all=True))
 
+  def test_has_arg_does_not_keep_bound_instance_alive(self):
+
+    class Layer(object):
+
+      def call(self, inputs, training=None):
+        return inputs
+
+    layer = Layer()
+    layer_ref = weakref.ref(layer)
+    self.assertTrue(generic_utils.has_arg(layer.call, 'training'))
+    self.assertFalse(generic_utils.has_arg(layer.call, 'mask'))
+    del layer
+    gc.collect()
+    self.assertIsNone(layer_ref())
+
 
 class TestCustomObjectScope(test.TestCase):
 
@@ -73,6 +95,28 @@ class TestCustomObjectScope(test.TestCase):
       cl = regularizers.get('CustomClass')
       self.assertEqual(cl.__class__, CustomClass)
 
+  def test_custom_object_scope_restores_shadowed_objects(self):
+
+    def custom_fn():
+      pass
+
+    def other_fn():
+      pass
+
+    custom_objects = generic_utils.get_custom_objects()
+    custom_objects['custom_fn'] = custom_fn
+    try:
+      with generic_utils.custom_object_scope(
+          {'custom_fn': other_fn}, {'other_fn': other_fn}):
+        self.assertIs(custom_objects['custom_fn'], other_fn)
+        with generic_utils.custom_object_scope({'other_fn': custom_fn}):
+          self.assertIs(custom_objects['other_fn'], custom_fn)
+        self.assertIs(custom_objects['other_fn'], other_fn)
+      self.assertIs(custom_objects['custom_fn'], custom_fn)
+      self.assertNotIn('other_fn', custom_objects)
+    finally:
+      del custom_objects['custom_fn']
+
 
 class SerializeKerasObjectTest(test.TestCase):
 
@@ -166,6 +210,55 @@ class SerializeKerasObjectTest(test.TestCase):
     fn_2 = generic_utils.get_registered_object(fn_class_name)
     self.assertEqual(42, fn_2())
 
+  def test_subclass_of_registered_class_is_not_registered(self):
+
+    @generic_utils.register_keras_serializable('TestPackage')
+    class ParentClass(object):
+
+      def get_config(self):
+        return {}
+
+    class ChildClass(ParentClass):
+      pass
+
+    self.assertEqual('TestPackage>ParentClass',
+                     generic_utils.get_registered_name(ParentClass))
+    self.assertEqual('ChildClass',
+                     generic_utils.get_registered_name(ChildClass))
+    config = generic_utils.serialize_keras_object(ChildClass())
+    self.assertEqual('ChildClass', config['class_name'])
+
+  def test_wrapper_of_registered_function_is_not_registered(self):
+
+    @generic_utils.register_keras_serializable('TestPackage')
+    def wrapped_fn():
+      return 1
+
+    @functools.wraps(wrapped_fn)
+    def wrapper_fn():
+      return 2
+
+    self.assertEqual('TestPackage>wrapped_fn',
+                     generic_utils.get_registered_name(wrapped_fn))
+    self.assertEqual('wrapped_fn',
+                     generic_utils.get_registered_name(wrapper_fn))
+
+    generic_utils.register_keras_serializable(
+        'TestPackage', 'wrapper_fn')(wrapper_fn)
+    self.assertEqual('TestPackage>wrapper_fn',
+                     generic_utils.get_registered_name(wrapper_fn))
+    self.assertEqual('TestPackage>wrapped_fn',
+                     generic_utils.get_registered_name(wrapped_fn))
+    config = generic_utils.serialize_keras_object(wrapper_fn)
+    self.assertEqual(2, generic_utils.deserialize_keras_object(config)())
+
+  def test_serialize_builtin_function(self):
+    generic_utils.register_keras_serializable('TestBuiltins')(math.sqrt)
+    self.assertEqual('TestBuiltins>sqrt',
+                     generic_utils.get_registered_name(math.sqrt))
+    config = generic_utils.serialize_keras_object(math.sqrt)
+    self.assertIs(math.sqrt, generic_utils.deserialize_keras_object(config))
+
   def test_serialize_custom_class_without_get_config_fails(self):
 
     with self.assertRaisesRegex(
@@ -302,6 +395,59 @@ class SerializeKerasObjectTest(test.TestCase):
     self.assertIs(new_layer.units.fn, serializable_fn)
 
 
+class SkipFailedSerializationTest(test.TestCase):
+
+  def test_skip_failed_serialization(self):
+
+    class NoConfigClass(object):
+
+      def get_config(self):
+        raise NotImplementedError
+
+    with self.assertRaises(NotImplementedError):
+      generic_utils.serialize_keras_object(NoConfigClass())
+
+    with generic_utils.skip_failed_serialization():
+      with generic_utils.skip_failed_serialization():
+        config = generic_utils.serialize_keras_object(NoConfigClass())
+      self.assertTrue(generic_utils._SKIP_FAILED_SERIALIZATION)
+    self.assertFalse(generic_utils._SKIP_FAILED_SERIALIZATION)
+    self.assertEqual('NoConfigClass', config['class_name'])
+    self.assertFalse(generic_utils.validate_config(config['config']))
+
+
+class MakeBatchesTest(test.TestCase):
+
+  def test_make_batches(self):
+    self.assertEqual(generic_utils.make_batches(0, 3), [])
+    self.assertEqual(generic_utils.make_batches(6, 3), [(0, 3), (3, 6)])
+    self.assertEqual(
+        generic_utils.make_batches(7, 3), [(0, 3), (3, 6), (6, 7)])
+
+
+class IsAllNoneTest(test.TestCase):
+
+  def test_is_all_none(self):
+    self.assertTrue(generic_utils.is_all_none(None))
+    self.assertTrue(generic_utils.is_all_none([]))
+    self.assertTrue(
+        generic_utils.is_all_none([None, (None, {'a': None, 'b': [None]})]))
+    self.assertFalse(generic_utils.is_all_none(0))
+    self.assertFalse(generic_utils.is_all_none([None, (None, {'a': [1]})]))
+    self.assertFalse(generic_utils.is_all_none([[None], {'a': None}, 'x']))
+
+
+class CheckForUnexpectedKeysTest(test.TestCase):
+
+  def test_check_for_unexpected_keys(self):
+    generic_utils.check_for_unexpected_keys(
+        'test', {'a': 1, 'b': 2}, ['a', 'b', 'c'])
+    generic_utils.check_for_unexpected_keys('test', {}, ('a',))
+    with self.assertRaisesRegex(ValueError, r"Unknown entries.*\['d'\]"):
+      generic_utils.check_for_unexpected_keys(
+          'test', {'a': 1, 'd': 2}, ['a', 'b', 'c'])
+
+
 class SliceArraysTest(test.TestCase):
 
   def test_slice_arrays(self):
@@ -316,6 +462,17 @@ class SliceArraysTest(test.TestCase):
         generic_utils.slice_arrays(input_a, start=0, stop=1),
         [None, None, None])
 
+  def test_slice_arrays_with_indices(self):
+    input_a = np.arange(10)
+    input_b = np.arange(10, 20)
+    indices = np.array([1, 3, 5])
+    self.assertAllEqual(
+        generic_utils.slice_arrays(input_a, indices), [1, 3, 5])
+    sliced = generic_utils.slice_arrays([input_a, None, input_b], indices)
+    self.assertAllEqual(sliced[0], [1, 3, 5])
+    self.assertIsNone(sliced[1])
+    self.assertAllEqual(sliced[2], [11, 13, 15])
+
 
 if __name__ == '__main__':
   test.main()